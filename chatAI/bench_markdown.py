@@ -0,0 +1,55 @@
+"""Micro-benchmark for study plan rendering: chained str.replace vs the styling treeprocessor.
+
+Usage: python bench_markdown.py [--sections 60] [--runs 50]
+"""
+import time
+import argparse
+import tracemalloc
+import markdown
+import markdown_styles
+
+def format_markdown_replace(text):
+    """The previous implementation: render, then 12 full-document str.replace passes."""
+    html = markdown.markdown(text)
+    for tag, css_class in markdown_styles.ELEMENT_CLASSES.items():
+        html = html.replace(f'<{tag}>', f'<{tag} class="{css_class}">')
+    for title in ('Key Topics and Concepts', 'Learning Objectives', 'Study Schedule',
+                  'Practice Exercises', 'Additional Resources', 'Progress Tracking'):
+        icon = markdown_styles.SECTION_ICONS[title.lower()]
+        html = html.replace(f'>{title}<', f'><i class="{icon}"></i> {title}<')
+    return html
+
+def make_plan(sections):
+    titles = ['Key Topics and Concepts', 'Learning Objectives', 'Study Schedule',
+              'Practice Exercises', 'Additional Resources', 'Progress Tracking']
+    parts = ['# Personalized Study Plan\n\nA motivating introduction paragraph for the learner.\n']
+    for i in range(sections):
+        parts.append(f'## {titles[i % len(titles)]}\n\nSection {i} overview with **bold** and *emphasis*.\n')
+        parts.append('\n'.join(f'- Item {j}: review the concept and practice for {j * 5} minutes' for j in range(10)))
+        parts.append('\n' + '\n'.join(f'{j}. Step {j} of the exercise' for j in range(1, 6)) + '\n')
+    return '\n'.join(parts)
+
+def measure(func, text, runs):
+    func(text)  # Warm up
+    start = time.perf_counter()
+    for _ in range(runs):
+        func(text)
+    elapsed = (time.perf_counter() - start) / runs
+    tracemalloc.start()
+    func(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sections', type=int, default=60)
+    parser.add_argument('--runs', type=int, default=50)
+    args = parser.parse_args()
+
+    text = make_plan(args.sections)
+    assert format_markdown_replace(text) == markdown_styles.render(text)
+    print(f"Plan: {len(text) / 1024:.0f} KB markdown, {args.runs} runs")
+    for name, func in (('str.replace', format_markdown_replace), ('treeprocessor', markdown_styles.render)):
+        elapsed, peak = measure(func, text, args.runs)
+        print(f"{name:14} {elapsed * 1000:7.2f} ms/render  peak {peak / 1024:8.0f} KB")
@@ -0,0 +1,218 @@
+"""Offline load test for app.py under gunicorn, using the fake Gemini backend.
+
+Starts gunicorn with GEMINI_BACKEND=fake and isolated cache/metrics directories,
+drives /generate_study_plan and/or /handle_test at the given concurrency (with
+optional generated sample PDFs) and reports latency percentiles, RPS, status
+codes and peak memory per worker.
+
+Examples:
+    python benchmark.py --requests 400 --concurrency 100
+    python benchmark.py --endpoint test --pdf-pages 50 --latency 2 --quota-rate 0.05
+    python benchmark.py --worker-class sync,gthread --requests 40 --latency 0.5
+"""
+import os
+import sys
+import time
+import uuid
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+ENDPOINTS = {
+    'study_plan': '/generate_study_plan',
+    'test': '/handle_test',
+}
+
+def make_sample_pdf(pages, lines_per_page=40):
+    """Build a minimal text-only PDF with the given number of pages."""
+    font_id = 3 + 2 * pages
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        ("<< /Type /Pages /Kids [%s] /Count %d >>"
+         % (' '.join(f"{3 + 2 * i} 0 R" for i in range(pages)), pages)).encode(),
+    ]
+    for i in range(pages):
+        lines = ' '.join(f"(Chapter {i} line {j}: photosynthesis converts light energy into chemical energy) '"
+                         for j in range(lines_per_page))
+        content = f"BT /F1 10 Tf 40 800 Td 12 TL {lines} ET".encode()
+        objects.append((f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                        f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {4 + 2 * i} 0 R >>").encode())
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return pdf
+
+def encode_multipart(fields, files):
+    """Encode form fields and (name, filename, bytes) files as multipart/form-data."""
+    boundary = uuid.uuid4().hex
+    body = b''
+    for name, value in fields.items():
+        body += (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n').encode()
+    for name, filename, data in files:
+        body += (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                 f'Content-Type: application/pdf\r\n\r\n').encode() + data + b'\r\n'
+    body += f'--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def worker_pids(master_pid):
+    """Return the PIDs of gunicorn workers forked by the master."""
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                if int(f.read().rsplit(')', 1)[1].split()[1]) == master_pid:
+                    pids.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    return pids
+
+def rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+class MemoryMonitor(threading.Thread):
+    """Sample peak RSS of each worker while the load test runs."""
+
+    def __init__(self, master_pid):
+        super().__init__(daemon=True)
+        self.master_pid = master_pid
+        self.peaks = {}
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(0.2):
+            for pid in worker_pids(self.master_pid):
+                self.peaks[pid] = max(self.peaks.get(pid, 0.0), rss_mb(pid))
+
+def wait_for_server(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url + '/cache_stats', timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start")
+
+def send(url, endpoint, i, args, pdf):
+    # Only a fraction of requests repeat content, to exercise the caches realistically
+    unique = (i % 100) < args.unique * 100
+    topic = f'benchmark topic {i if unique else i % 5} {args.run_id if unique else ""}'
+    files = [('pdf', 'sample.pdf', pdf)] if pdf else []
+    body, content_type = encode_multipart({'text': topic}, files)
+    request = urllib.request.Request(url + ENDPOINTS[endpoint], data=body, headers={'Content-Type': content_type})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=args.timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = 'error'
+    return endpoint, status, time.perf_counter() - start
+
+def run(worker_class, args):
+    workdir = tempfile.mkdtemp(prefix='learnnearn-bench-')
+    port = args.port
+    url = f'http://127.0.0.1:{port}'
+    env = dict(
+        os.environ,
+        GEMINI_BACKEND='fake',
+        FAKE_LATENCY=str(args.latency),
+        FAKE_ERROR_RATE=str(args.error_rate),
+        FAKE_QUOTA_RATE=str(args.quota_rate),
+        GEMINI_RPM=str(args.rpm),
+        GEMINI_TPM=str(args.rpm * 100000),
+        CACHE_PATH=os.path.join(workdir, 'cache.sqlite3'),
+        PDF_TEXT_CACHE_DIR=os.path.join(workdir, 'pdf-text'),
+        LOCK_DIR=os.path.join(workdir, 'locks'),
+        METRICS_DIR=os.path.join(workdir, 'metrics'),
+        MODEL_RECORD_PATH=os.path.join(workdir, 'model.json'),
+        PORT=str(port),
+        WEB_CONCURRENCY=str(args.workers),
+        GUNICORN_WORKER_CLASS=worker_class,
+        # gunicorn silently upgrades sync workers to gthread when threads > 1
+        GUNICORN_THREADS=str(1 if worker_class == 'sync' else args.threads),
+    )
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'app:app', '--log-level', 'warning'],
+                              cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL if args.quiet else None)
+    pdf = make_sample_pdf(args.pdf_pages) if args.pdf_pages else None
+    endpoints = list(ENDPOINTS) if args.endpoint == 'both' else [args.endpoint]
+    try:
+        wait_for_server(url)
+        monitor = MemoryMonitor(server.pid)
+        monitor.start()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(lambda i: send(url, endpoints[i % len(endpoints)], i, args, pdf),
+                                    range(args.requests)))
+        elapsed = time.perf_counter() - start
+        monitor.stopped.set()
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{worker_class} workers={args.workers} threads={env['GUNICORN_THREADS']} "
+          f"concurrency={args.concurrency} latency={args.latency}s pdf_pages={args.pdf_pages}")
+    print(f"  {args.requests} requests in {elapsed:.2f}s = {args.requests / elapsed:.1f} req/s")
+    for endpoint in endpoints:
+        latencies = sorted(latency for name, _, latency in results if name == endpoint)
+        statuses = Counter(status for name, status, _ in results if name == endpoint)
+        print(f"  {ENDPOINTS[endpoint]:22} p50 {percentile(latencies, 0.5):6.2f}s  "
+              f"p99 {percentile(latencies, 0.99):6.2f}s  max {latencies[-1]:6.2f}s  "
+              f"status {dict(statuses)}")
+    for pid, peak in sorted(monitor.peaks.items()):
+        print(f"  worker {pid}: peak RSS {peak:.0f} MB")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--endpoint', choices=['study_plan', 'test', 'both'], default='both')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--unique', type=float, default=1.0, help='Fraction of requests with unique content')
+    parser.add_argument('--pdf-pages', type=int, default=0, help='Attach a generated PDF with this many pages')
+    parser.add_argument('--latency', type=float, default=1.0, help='Fake model latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--quota-rate', type=float, default=0.0)
+    parser.add_argument('--rpm', type=int, default=100000, help='Rate limiter requests per minute')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=200)
+    parser.add_argument('--worker-class', default='gthread', help='Comma-separated, e.g. sync,gthread')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--quiet', action='store_true', help='Hide server logs')
+    args = parser.parse_args()
+    args.run_id = uuid.uuid4().hex[:8]
+    for worker_class in args.worker_class.split(','):
+        run(worker_class, args)
@@ -0,0 +1,136 @@
+import time
+import threading
+import logging
+from collections import deque
+from cache import get_connection, rollback, DEFAULT_DB_PATH
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class ModelsUnavailable(Exception):
+    """Raised when every model's circuit is open; retry_after is when the first can be probed again."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"All models are temporarily unavailable (503), retry after {retry_after:.1f} seconds")
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """Per-model circuit breakers shared by all workers through SQLite.
+
+    A model's circuit opens after failure_threshold consecutive failures and skips
+    the model for open_seconds. After that, one caller gets to probe it (half-open):
+    success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, failure_threshold=5, open_seconds=30):
+        self.path = path
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self._transitions = metrics.counter('learnnearn_circuit_transitions_total',
+                                            'Model circuit breaker state changes', ['model', 'state'])
+        get_connection(path).execute('''
+            CREATE TABLE IF NOT EXISTS model_health (
+                model TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                failures INTEGER NOT NULL DEFAULT 0,
+                opened_at REAL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+
+    def allow(self, model):
+        """Return whether a request may go to model, claiming the probe of a half-open circuit."""
+        conn = get_connection(self.path)
+        row = conn.execute('SELECT state, opened_at FROM model_health WHERE model = ?', (model,)).fetchone()
+        if row is None or row[0] == CLOSED:
+            return True
+        now = time.time()
+        if now - row[1] < self.open_seconds:
+            return False
+        # Only one worker wins the probe; a probe that never reported back is retried after open_seconds
+        claimed = conn.execute(
+            'UPDATE model_health SET state = ?, opened_at = ?, updated_at = ? '
+            'WHERE model = ? AND state IN (?, ?) AND opened_at <= ?',
+            (HALF_OPEN, now, now, model, OPEN, HALF_OPEN, now - self.open_seconds)
+        ).rowcount
+        if claimed:
+            logger.info(f"Probing {model} after its circuit was open")
+            self._transitions.inc(model=model, state=HALF_OPEN)
+        return bool(claimed)
+
+    def record_success(self, model):
+        """Reset the failure count and close the circuit."""
+        conn = get_connection(self.path)
+        row = conn.execute('SELECT state, failures FROM model_health WHERE model = ?', (model,)).fetchone()
+        if row is None or row == (CLOSED, 0):
+            return
+        conn.execute('UPDATE model_health SET state = ?, failures = 0, opened_at = NULL, updated_at = ? WHERE model = ?',
+                     (CLOSED, time.time(), model))
+        if row[0] != CLOSED:
+            logger.info(f"Closing circuit for {model}")
+            self._transitions.inc(model=model, state=CLOSED)
+
+    def record_failure(self, model):
+        """Count a failure and open the circuit once the threshold is reached (or a probe failed)."""
+        conn = get_connection(self.path)
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT state, failures, opened_at FROM model_health WHERE model = ?', (model,)).fetchone()
+            state, failures, opened_at = row if row else (CLOSED, 0, None)
+            failures += 1
+            if state == HALF_OPEN or (state == CLOSED and failures >= self.failure_threshold):
+                state, opened_at = OPEN, now
+                logger.warning(f"Opening circuit for {model} after {failures} consecutive failures")
+                self._transitions.inc(model=model, state=OPEN)
+            conn.execute(
+                'INSERT OR REPLACE INTO model_health (model, state, failures, opened_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (model, state, failures, opened_at, now)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            rollback(conn)
+            raise
+
+    def retry_after(self, models):
+        """Seconds until the first of models may be tried again (0 if one is usable now)."""
+        rows = dict((model, (state, opened_at)) for model, state, opened_at in get_connection(self.path).execute(
+            'SELECT model, state, opened_at FROM model_health'))
+        now = time.time()
+        waits = []
+        for model in models:
+            state, opened_at = rows.get(model, (CLOSED, None))
+            waits.append(0.0 if state == CLOSED else max(0.0, opened_at + self.open_seconds - now))
+        return min(waits, default=0.0)
+
+    def states(self):
+        """Return the circuit state and consecutive failures of every model seen so far."""
+        rows = get_connection(self.path).execute('SELECT model, state, failures FROM model_health')
+        return {model: {"state": state, "failures": failures} for model, state, failures in rows}
+
+class LatencyWindow:
+    """Recent successful call latencies per model, kept in-process, for hedging decisions."""
+
+    def __init__(self, size=200):
+        self.size = size
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def observe(self, model, seconds):
+        with self._lock:
+            samples = self._samples.get(model)
+            if samples is None:
+                samples = self._samples[model] = deque(maxlen=self.size)
+            samples.append(seconds)
+
+    def percentile(self, model, fraction, min_samples=20):
+        """Return the latency percentile for a model, or None with too few samples."""
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * fraction))]
@@ -0,0 +1,584 @@
+import os
+import json
+import zlib
+import hashlib
+import time
+import sqlite3
+import tempfile
+import threading
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: coalescing stays within a single process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(tempfile.gettempdir(), 'learnnearn-cache.sqlite3')
+DEFAULT_TEXT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'learnnearn-pdf-text')
+DEFAULT_LOCK_DIR = os.path.join(tempfile.gettempdir(), 'learnnearn-locks')
+
+_local = threading.local()
+
+def get_connection(path):
+    """Return a per-thread, per-process SQLite connection for the given path."""
+    connections = getattr(_local, 'connections', None)
+    # Connections must not be shared across a fork (gunicorn workers)
+    if connections is None or getattr(_local, 'pid', None) != os.getpid():
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+    conn = connections.get(path)
+    if conn is None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        connections[path] = conn
+    return conn
+
+def rollback(conn):
+    """Roll back the open transaction, if any, so a failed BEGIN or COMMIT does not mask the original error."""
+    if conn.in_transaction:
+        conn.execute('ROLLBACK')
+
+def init_stats(conn, namespace):
+    """Create the shared hit/miss/eviction counters table and a row for the namespace."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cache_stats (
+            namespace TEXT PRIMARY KEY,
+            hits INTEGER NOT NULL DEFAULT 0,
+            misses INTEGER NOT NULL DEFAULT 0,
+            evictions INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO cache_stats (namespace) VALUES (?)', (namespace,))
+
+def count_stat(conn, namespace, column, amount=1):
+    """Increment one of the shared counters for a namespace."""
+    conn.execute(f'UPDATE cache_stats SET {column} = {column} + ? WHERE namespace = ?', (amount, namespace))
+
+def read_stats(conn, namespace):
+    """Return the shared counters for a namespace."""
+    hits, misses, evictions = conn.execute(
+        'SELECT hits, misses, evictions FROM cache_stats WHERE namespace = ?', (namespace,)
+    ).fetchone()
+    return {'hits': hits, 'misses': misses, 'evictions': evictions}
+
+class BufferedStats:
+    """Hit/miss counters kept in-process and added to the shared stats table in batches.
+
+    Lookups then only need a write transaction once per max_pending counts or
+    max_age seconds instead of on every call.
+    """
+
+    def __init__(self, path, namespace, max_pending=100, max_age=5.0):
+        self.path = path
+        self.namespace = namespace
+        self.max_pending = max_pending
+        self.max_age = max_age
+        self._pending = {'hits': 0, 'misses': 0}
+        self._flushed_at = time.time()
+        self._lock = threading.Lock()
+
+    def count(self, column, amount=1):
+        with self._lock:
+            self._pending[column] += amount
+            due = (sum(self._pending.values()) >= self.max_pending
+                   or time.time() - self._flushed_at >= self.max_age)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write the pending counts to the shared table."""
+        with self._lock:
+            pending, self._pending = self._pending, {'hits': 0, 'misses': 0}
+            self._flushed_at = time.time()
+        if not any(pending.values()):
+            return
+        try:
+            get_connection(self.path).execute(
+                'UPDATE cache_stats SET hits = hits + ?, misses = misses + ? WHERE namespace = ?',
+                (pending['hits'], pending['misses'], self.namespace)
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Could not update {self.namespace} cache stats: {str(e)}")
+
+def _entry_size(value):
+    """Approximate the size of a cached value in bytes."""
+    return len(json.dumps(value).encode())
+
+class MemoryCache:
+    """In-process LRU cache with TTL expiry and entry/byte bounds."""
+
+    def __init__(self, namespace, ttl, max_entries=1000, max_bytes=50 * 1024 * 1024):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        """Return the cached value or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            value, size, expires_at = entry
+            if expires_at <= time.time():
+                self._remove(key)
+                self._stats['misses'] += 1
+                self._stats['evictions'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store a value and evict expired/least recently used entries.
+
+        ttl overrides the cache-wide TTL for this entry (in seconds).
+        """
+        size = _entry_size(value)
+        if size > self.max_bytes:
+            logger.warning(f"Not caching {self.namespace} entry of {size} bytes (limit {self.max_bytes})")
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, time.time() + (self.ttl if ttl is None else ttl))
+            self._bytes += size
+            self._evict()
+
+    def delete(self, key):
+        """Remove a single entry if present."""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def stats(self):
+        """Return hit/miss/eviction counters and current size."""
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), bytes=self._bytes)
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _evict(self):
+        now = time.time()
+        for key in [k for k, (_, _, expires_at) in self._entries.items() if expires_at <= now]:
+            self._remove(key)
+            self._stats['evictions'] += 1
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            key = next(iter(self._entries))
+            self._remove(key)
+            self._stats['evictions'] += 1
+
+class SQLiteCache:
+    """LRU cache with TTL expiry stored in SQLite so all workers share entries.
+
+    Reads take no write lock: an entry's LRU timestamp is only refreshed once it
+    is older than touch_fraction of the TTL, and hit/miss counters are batched.
+    Expired entries are removed by the eviction pass on the next write. Entry
+    count and total size are kept as running totals, so writes never scan the
+    whole namespace.
+    """
+
+    def __init__(self, namespace, ttl, max_entries=1000, max_bytes=50 * 1024 * 1024, path=DEFAULT_DB_PATH,
+                 touch_fraction=0.1):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.path = path
+        self.touch_fraction = touch_fraction
+        self._init_schema()
+        self._lookups = BufferedStats(path, namespace)
+
+    def _conn(self):
+        return get_connection(self.path)
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_lru ON cache_entries (namespace, accessed_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_expiry ON cache_entries (namespace, expires_at)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache_sizes (
+                namespace TEXT PRIMARY KEY,
+                entries INTEGER NOT NULL,
+                bytes INTEGER NOT NULL
+            )
+        ''')
+        conn.execute('INSERT OR IGNORE INTO cache_sizes (namespace, entries, bytes) '
+                     'SELECT ?, COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?',
+                     (self.namespace, self.namespace))
+        init_stats(conn, self.namespace)
+
+    def _count(self, conn, column, amount=1):
+        count_stat(conn, self.namespace, column, amount)
+
+    def _resize(self, conn, entries, size):
+        """Adjust the running entry count and byte total."""
+        conn.execute('UPDATE cache_sizes SET entries = entries + ?, bytes = bytes + ? WHERE namespace = ?',
+                     (entries, size, self.namespace))
+
+    def _size(self, conn):
+        return conn.execute('SELECT entries, bytes FROM cache_sizes WHERE namespace = ?', (self.namespace,)).fetchone()
+
+    def get(self, key):
+        """Return the cached value or None if missing or expired."""
+        conn = self._conn()
+        now = time.time()
+        try:
+            row = conn.execute(
+                'SELECT value, expires_at, accessed_at FROM cache_entries WHERE namespace = ? AND key = ?',
+                (self.namespace, key)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                self._lookups.count('misses')
+                return None
+            value, _, accessed_at = row
+            if now - accessed_at > self.ttl * self.touch_fraction:
+                conn.execute('UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?',
+                             (now, self.namespace, key))
+            self._lookups.count('hits')
+            return json.loads(value)
+        except Exception as e:
+            logger.error(f"Error reading {self.namespace} cache: {str(e)}")
+            return None
+
+    def set(self, key, value, ttl=None):
+        """Store a value and evict expired/least recently used entries.
+
+        ttl overrides the cache-wide TTL for this entry (in seconds).
+        """
+        payload = json.dumps(value)
+        size = len(payload.encode())
+        if size > self.max_bytes:
+            logger.warning(f"Not caching {self.namespace} entry of {size} bytes (limit {self.max_bytes})")
+            return
+        conn = self._conn()
+        now = time.time()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            old = conn.execute('SELECT size FROM cache_entries WHERE namespace = ? AND key = ?',
+                               (self.namespace, key)).fetchone()
+            conn.execute(
+                'INSERT OR REPLACE INTO cache_entries (namespace, key, value, size, expires_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (self.namespace, key, payload, size, now + (self.ttl if ttl is None else ttl), now)
+            )
+            self._resize(conn, 0 if old else 1, size - (old[0] if old else 0))
+            self._evict(conn, now)
+            conn.execute('COMMIT')
+        except Exception as e:
+            rollback(conn)
+            logger.error(f"Error writing {self.namespace} cache: {str(e)}")
+
+    def delete(self, key):
+        """Remove a single entry if present."""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            old = conn.execute('SELECT size FROM cache_entries WHERE namespace = ? AND key = ?',
+                               (self.namespace, key)).fetchone()
+            if old:
+                conn.execute('DELETE FROM cache_entries WHERE namespace = ? AND key = ?', (self.namespace, key))
+                self._resize(conn, -1, -old[0])
+            conn.execute('COMMIT')
+        except Exception:
+            rollback(conn)
+            raise
+
+    def stats(self):
+        """Return hit/miss/eviction counters and current size across all workers."""
+        self._lookups.flush()
+        conn = self._conn()
+        entries, total_bytes = self._size(conn)
+        return dict(read_stats(conn, self.namespace), entries=entries, bytes=total_bytes)
+
+    def _evict(self, conn, now, batch=100):
+        expired, expired_bytes = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ? AND expires_at <= ?',
+            (self.namespace, now)
+        ).fetchone()
+        if expired:
+            conn.execute('DELETE FROM cache_entries WHERE namespace = ? AND expires_at <= ?', (self.namespace, now))
+            self._resize(conn, -expired, -expired_bytes)
+        evicted = expired
+
+        # Read only the least recently used rows beyond the bounds, a batch at a time
+        entries, total_bytes = self._size(conn)
+        while entries > self.max_entries or total_bytes > self.max_bytes:
+            limit = max(entries - self.max_entries, 1) if total_bytes <= self.max_bytes else batch
+            rows = conn.execute(
+                'SELECT key, size FROM cache_entries WHERE namespace = ? ORDER BY accessed_at LIMIT ?',
+                (self.namespace, limit)
+            ).fetchall()
+            if not rows:
+                break
+            victims = []
+            for key, size in rows:
+                if entries <= self.max_entries and total_bytes <= self.max_bytes:
+                    break
+                victims.append((self.namespace, key))
+                entries -= 1
+                total_bytes -= size
+            conn.executemany('DELETE FROM cache_entries WHERE namespace = ? AND key = ?', victims)
+            self._resize(conn, -len(victims), -sum(size for _, size in rows[:len(victims)]))
+            evicted += len(victims)
+        if evicted:
+            self._count(conn, 'evictions', evicted)
+
+class TieredCache:
+    """In-memory LRU in front of a shared SQLite cache.
+
+    Reads are served from memory when possible. Misses fall through to SQLite and
+    are promoted to memory, so entries survive worker restarts and are visible to
+    every worker.
+    """
+
+    def __init__(self, front, back):
+        self.front = front
+        self.back = back
+
+    def get(self, key):
+        """Return the value from memory or the shared store, or None."""
+        value = self.front.get(key)
+        if value is None:
+            value = self.back.get(key)
+            if value is not None:
+                self.front.set(key, value)
+        return value
+
+    def set(self, key, value, ttl=None):
+        """Store a value in both tiers."""
+        self.back.set(key, value, ttl=ttl)
+        self.front.set(key, value, ttl=ttl)
+
+    def delete(self, key):
+        """Remove a key from both tiers."""
+        self.front.delete(key)
+        self.back.delete(key)
+
+    def stats(self):
+        """Return counters for both tiers."""
+        return {'memory': self.front.stats(), 'shared': self.back.stats()}
+
+class TextCache:
+    """Content-addressed, zlib-compressed text cache on local disk, evicted by total size.
+
+    Keys are SHA-256 digests of the source bytes, so identical uploads share an entry
+    across workers. Hit/miss/eviction counters live in the shared SQLite stats table.
+    """
+
+    def __init__(self, directory=DEFAULT_TEXT_CACHE_DIR, max_bytes=200 * 1024 * 1024,
+                 namespace='pdf_text', stats_path=DEFAULT_DB_PATH):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.namespace = namespace
+        self.stats_path = stats_path
+        os.makedirs(directory, exist_ok=True)
+        init_stats(get_connection(stats_path), namespace)
+        self._lookups = BufferedStats(stats_path, namespace)
+
+    @staticmethod
+    def digest(data):
+        """Return the content address (SHA-256 hex digest) of raw bytes."""
+        return hashlib.sha256(data).hexdigest()
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest[:2], f"{digest}.z")
+
+    def get(self, digest):
+        """Return the cached text for a digest, or None."""
+        path = self._path(digest)
+        try:
+            with open(path, 'rb') as f:
+                text = zlib.decompress(f.read()).decode()
+            os.utime(path)  # Mark as recently used for eviction
+        except (OSError, zlib.error, UnicodeDecodeError):
+            self._lookups.count('misses')
+            return None
+        self._lookups.count('hits')
+        return text
+
+    def set(self, digest, text):
+        """Store compressed text for a digest and evict the oldest entries over the size bound."""
+        path = self._path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            with tempfile.NamedTemporaryFile('wb', dir=os.path.dirname(path), delete=False) as f:
+                f.write(zlib.compress(text.encode(), 6))
+            os.replace(f.name, path)
+        except OSError as e:
+            logger.warning(f"Could not write {self.namespace} cache entry: {str(e)}")
+            return
+        self._evict()
+
+    def stats(self):
+        """Return shared counters plus the current on-disk footprint."""
+        self._lookups.flush()
+        files = self._files()
+        stats = read_stats(get_connection(self.stats_path), self.namespace)
+        lookups = stats['hits'] + stats['misses']
+        return dict(stats, entries=len(files), bytes=sum(size for _, size, _ in files),
+                    hit_ratio=stats['hits'] / lookups if lookups else 0.0)
+
+    def _files(self):
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith('.z'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((path, st.st_size, st.st_mtime))
+        return files
+
+    def _evict(self):
+        files = self._files()
+        total_bytes = sum(size for _, size, _ in files)
+        evicted = 0
+        for path, size, _ in sorted(files, key=lambda f: f[2]):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total_bytes -= size
+            evicted += 1
+        if evicted:
+            count_stat(get_connection(self.stats_path), self.namespace, 'evictions', evicted)
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key so only one of them does the work.
+
+    Within a process, duplicates wait on the leader's result. Across processes, the
+    leader holds an exclusive lock file; other workers block on it and then find the
+    result through the shared cache lookup.
+    """
+
+    def __init__(self, lock_dir=DEFAULT_LOCK_DIR, stripes=64):
+        self.lock_dir = lock_dir
+        self.stripes = stripes
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stripe_locks = [threading.Lock() for _ in range(stripes)]
+        os.makedirs(lock_dir, exist_ok=True)
+
+    @contextmanager
+    def lock(self, key):
+        """Hold an exclusive lock for key across threads and workers, for short read-modify-write sections.
+
+        Keys share a fixed set of lock files, so unrelated keys occasionally wait on each other.
+        """
+        stripe = int(hashlib.md5(key.encode()).hexdigest(), 16) % self.stripes
+        with self._stripe_locks[stripe]:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.lock_dir, f"stripe-{stripe}.lock"), 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def do(self, key, func, lookup):
+        """Return lookup() if it has a result, otherwise func(), running func once per key."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+        
+        if not leader:
+            logger.info("Waiting for identical in-flight request")
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+        
+        try:
+            call['result'] = self._run_locked(key, func, lookup)
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+
+    def _run_locked(self, key, func, lookup):
+        if fcntl is None:
+            return func()
+        path = os.path.join(self.lock_dir, f"{key}.lock")
+        with open(path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # Another worker may have finished while we waited for the lock
+                result = lookup()
+                if result is not None:
+                    logger.info("Identical request completed by another worker")
+                    return result
+                result = func()
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+class InstrumentedCache:
+    """Wrap a cache to export lookup latency and hit/miss counters as metrics."""
+
+    def __init__(self, name, cache):
+        self.name = name
+        self.cache = cache
+        self._lookups = metrics.counter('learnnearn_cache_lookups_total', 'Cache lookups by result', ['cache', 'result'])
+        self._latency = metrics.histogram('learnnearn_cache_lookup_seconds', 'Cache lookup latency', ['cache'])
+
+    def get(self, key):
+        with self._latency.time(cache=self.name):
+            value = self.cache.get(key)
+        self._lookups.inc(cache=self.name, result='miss' if value is None else 'hit')
+        return value
+
+    def __getattr__(self, name):
+        return getattr(self.cache, name)
+
+def create_cache(namespace, ttl, backend='sqlite', max_entries=1000, max_bytes=50 * 1024 * 1024, path=DEFAULT_DB_PATH):
+    """Create a response cache for the configured backend ('sqlite' or 'memory')."""
+    if backend == 'memory':
+        return MemoryCache(namespace, ttl, max_entries=max_entries, max_bytes=max_bytes)
+    if backend == 'sqlite':
+        return SQLiteCache(namespace, ttl, max_entries=max_entries, max_bytes=max_bytes, path=path)
+    raise ValueError(f"Unknown cache backend: {backend}")
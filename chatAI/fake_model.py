@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import random
+import asyncio
+
+# Tunables for the offline Gemini stand-in (GEMINI_BACKEND=fake)
+FAKE_LATENCY = float(os.getenv('FAKE_LATENCY', 1.0))  # Seconds per response
+FAKE_JITTER = float(os.getenv('FAKE_JITTER', 0.2))  # Extra random latency, as a fraction of FAKE_LATENCY
+FAKE_STREAM_CHUNKS = int(os.getenv('FAKE_STREAM_CHUNKS', 8))
+FAKE_ERROR_RATE = float(os.getenv('FAKE_ERROR_RATE', 0.0))  # Probability of a generic 500 error
+FAKE_QUOTA_RATE = float(os.getenv('FAKE_QUOTA_RATE', 0.0))  # Probability of a 429 quota error
+FAKE_FAILING_MODELS = set(filter(None, os.getenv('FAKE_FAILING_MODELS', '').split(',')))  # Models that always fail
+FAKE_SLOW_MODELS = set(filter(None, os.getenv('FAKE_SLOW_MODELS', '').split(',')))  # Models with FAKE_SLOW_LATENCY
+FAKE_SLOW_LATENCY = float(os.getenv('FAKE_SLOW_LATENCY', 10.0))
+
+SECTIONS = [
+    'Key Topics and Concepts',
+    'Learning Objectives',
+    'Study Schedule',
+    'Practice Exercises',
+    'Additional Resources',
+    'Progress Tracking',
+]
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+def fake_study_plan(prompt):
+    parts = ['# Personalized Study Plan\n\nA focused plan generated offline for benchmarking.\n']
+    for title in SECTIONS:
+        parts.append(f'## {title}\n')
+        parts.extend(f'- {title} item {i}: spend {15 * (i + 1)} minutes on it' for i in range(6))
+        parts.append('')
+    return '\n'.join(parts)
+
+def fake_test(prompt):
+    difficulties = ['basic'] * 3 + ['intermediate'] * 3 + ['advanced'] * 2
+    return json.dumps({
+        'questions': [
+            {
+                'text': f'Sample question {i + 1}?',
+                'options': [f'Option {letter}' for letter in 'ABCD'],
+                'correct': i % 4,
+                'explanation': f'Option {"ABCD"[i % 4]} is correct.',
+                'difficulty': difficulty,
+            }
+            for i, difficulty in enumerate(difficulties)
+        ]
+    })
+
+def fake_summary(prompt):
+    return '\n'.join(f'- Summary point {i}' for i in range(10))
+
+def fake_text(prompt, system_instruction=None):
+    instructions = system_instruction or prompt
+    if '"questions"' in instructions:
+        return fake_test(prompt)
+    if instructions.startswith('Summarize'):
+        return fake_summary(prompt)
+    return fake_study_plan(prompt)
+
+class FakeGenerativeModel:
+    """Offline stand-in for genai.GenerativeModel with tunable latency and failures."""
+
+    def __init__(self, model_name, system_instruction=None):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+
+    def _latency(self):
+        base = FAKE_SLOW_LATENCY if self.model_name in FAKE_SLOW_MODELS else FAKE_LATENCY
+        return base * (1 + random.uniform(0, FAKE_JITTER))
+
+    def _maybe_fail(self):
+        if self.model_name in FAKE_FAILING_MODELS:
+            raise Exception(f"503 The model {self.model_name} is overloaded (fake backend)")
+        roll = random.random()
+        if roll < FAKE_QUOTA_RATE:
+            raise Exception("429 Resource has been exhausted (e.g. check quota).")
+        if roll < FAKE_QUOTA_RATE + FAKE_ERROR_RATE:
+            raise Exception("500 An internal error has occurred (fake backend)")
+
+    def _chunks(self, text):
+        size = max(1, -(-len(text) // FAKE_STREAM_CHUNKS))
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def _stream(self, text, latency):
+        for chunk in self._chunks(text):
+            time.sleep(latency / FAKE_STREAM_CHUNKS)
+            yield FakeResponse(chunk)
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        latency = self._latency()
+        self._maybe_fail()
+        text = fake_text(prompt, self.system_instruction)
+        if stream:
+            return self._stream(text, latency)
+        time.sleep(latency)
+        return FakeResponse(text)
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        latency = self._latency()
+        await asyncio.sleep(latency)
+        self._maybe_fail()
+        return FakeResponse(fake_text(prompt, self.system_instruction))
@@ -0,0 +1,14 @@
+import os
+
+# Gemini calls run on a per-worker asyncio loop, so request threads only wait on
+# futures. Threaded workers let each process keep many generations in flight.
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', 200))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+
+def on_starting(server):
+    # Start each server with fresh per-worker metric files
+    import metrics
+    metrics.clear()
@@ -0,0 +1,293 @@
+import os
+import json
+import time
+import uuid
+import socket
+import ipaddress
+import threading
+import logging
+import urllib.parse
+import urllib.request
+from cache import get_connection, rollback, DEFAULT_DB_PATH
+import metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+FINISHED = (DONE, FAILED)
+
+class JobFailed(Exception):
+    """Raised by a job handler to fail a job with a client-facing error dict."""
+
+    def __init__(self, error):
+        super().__init__(error.get('error', 'Job failed'))
+        self.error = error
+
+def check_webhook_url(url, allowed_hosts=None):
+    """Raise ValueError unless url is an http(s) URL on an allowed host that resolves only to public addresses.
+
+    Loopback, private, link-local and other non-global addresses are always
+    rejected, so a callback cannot reach internal services.
+    """
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        raise ValueError("Callback URL must be http(s)")
+    host = parsed.hostname.lower()
+    if allowed_hosts and host not in allowed_hosts:
+        raise ValueError(f"Callback host {host} is not allowed")
+    try:
+        port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)}
+    except (OSError, ValueError):
+        raise ValueError(f"Callback host {host} could not be resolved")
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%')[0])
+        if getattr(ip, 'ipv4_mapped', None):
+            ip = ip.ipv4_mapped
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError(f"Callback host {host} resolves to a non-public address")
+
+class NoRedirects(urllib.request.HTTPRedirectHandler):
+    """Refuse redirects, which could point a checked callback at an internal address."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+class JobQueue:
+    """Durable job queue shared by all workers through SQLite.
+
+    A worker claims a job by leasing it; if the worker dies, the lease runs out and
+    another worker picks the job up again, up to max_attempts times. Finished jobs
+    keep their result for result_ttl seconds so clients can poll or resubmit.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, lease=300, max_attempts=3, result_ttl=86400):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.result_ttl = result_ttl
+        conn = get_connection(path)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                dedupe_key TEXT,
+                status TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                callback_url TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_until REAL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_dedupe ON jobs (kind, dedupe_key)')
+
+    def submit(self, kind, payload, dedupe_key=None, callback_url=None):
+        """Queue a job and return its ID.
+
+        A job with the same kind and dedupe_key that is pending or finished successfully
+        is reused instead of queueing the same work twice. Submissions with a callback_url
+        always get their own job, so every callback fires.
+        """
+        conn = get_connection(self.path)
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if dedupe_key is not None and callback_url is None:
+                row = conn.execute(
+                    'SELECT id FROM jobs WHERE kind = ? AND dedupe_key = ? AND status != ? AND created_at > ? '
+                    'ORDER BY created_at DESC LIMIT 1',
+                    (kind, dedupe_key, FAILED, now - self.result_ttl)
+                ).fetchone()
+                if row is not None:
+                    conn.execute('COMMIT')
+                    logger.info(f"Reusing job {row[0]} for identical {kind} request")
+                    return row[0]
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                'INSERT INTO jobs (id, kind, dedupe_key, status, payload, callback_url, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, kind, dedupe_key, QUEUED, json.dumps(payload), callback_url, now, now)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            rollback(conn)
+            raise
+        return job_id
+
+    def claim(self):
+        """Lease the oldest runnable job; returns (id, kind, payload, attempts) or None."""
+        conn = get_connection(self.path)
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Jobs whose worker died have an expired lease and are runnable again
+            row = conn.execute(
+                'SELECT id, kind, payload, attempts FROM jobs '
+                'WHERE status = ? OR (status = ? AND lease_until < ?) ORDER BY created_at LIMIT 1',
+                (QUEUED, RUNNING, now)
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            job_id, kind, payload, attempts = row
+            if attempts >= self.max_attempts:
+                conn.execute('UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?',
+                             (FAILED, json.dumps({"error": "Job was interrupted too many times"}), now, job_id))
+                conn.execute('COMMIT')
+                return self.claim()
+            conn.execute('UPDATE jobs SET status = ?, attempts = ?, lease_until = ?, updated_at = ? WHERE id = ?',
+                         (RUNNING, attempts + 1, now + self.lease, now, job_id))
+            conn.execute('COMMIT')
+        except Exception:
+            rollback(conn)
+            raise
+        return job_id, kind, json.loads(payload), attempts + 1
+
+    def finish(self, job_id, result=None, error=None):
+        """Store the result (or error dict) of a job and return its callback URL."""
+        conn = get_connection(self.path)
+        conn.execute(
+            'UPDATE jobs SET status = ?, result = ?, error = ?, lease_until = NULL, updated_at = ? WHERE id = ?',
+            (FAILED if error is not None else DONE,
+             None if result is None else json.dumps(result),
+             None if error is None else json.dumps(error),
+             time.time(), job_id)
+        )
+        row = conn.execute('SELECT callback_url FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def get(self, job_id):
+        """Return the public state of a job, or None if it is unknown or expired."""
+        row = get_connection(self.path).execute(
+            'SELECT id, kind, status, result, error, attempts, created_at, updated_at FROM jobs WHERE id = ?',
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job_id, kind, status, result, error, attempts, created_at, updated_at = row
+        job = {
+            "job_id": job_id,
+            "kind": kind,
+            "status": status,
+            "attempts": attempts,
+            "created_at": created_at,
+            "updated_at": updated_at
+        }
+        if status == QUEUED:
+            job["position"] = self.position(created_at)
+        if result is not None:
+            job["result"] = json.loads(result)
+        if error is not None:
+            job["error"] = json.loads(error)
+        return job
+
+    def position(self, created_at):
+        """Number of queued jobs ahead of a job created at created_at."""
+        return get_connection(self.path).execute(
+            'SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?', (QUEUED, created_at)
+        ).fetchone()[0]
+
+    def purge(self):
+        """Delete finished jobs older than result_ttl."""
+        conn = get_connection(self.path)
+        cutoff = time.time() - self.result_ttl
+        conn.execute('DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?', (*FINISHED, cutoff))
+
+    def counts(self):
+        """Return the number of jobs by status."""
+        rows = get_connection(self.path).execute('SELECT status, COUNT(*) FROM jobs GROUP BY status')
+        return dict(rows.fetchall())
+
+class JobWorkers:
+    """Per-process pool of threads that run queued jobs outside of request threads.
+
+    Every web worker runs its own pool, so the queue keeps draining when one of them
+    restarts. Handlers map a job kind to a function taking the payload and returning
+    a JSON-serializable result.
+    """
+
+    def __init__(self, queue, handlers, threads=2, poll_interval=0.5, webhook_timeout=10, webhook_hosts=None):
+        self.queue = queue
+        self.handlers = handlers
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.webhook_timeout = webhook_timeout
+        self.webhook_hosts = webhook_hosts
+        self._opener = urllib.request.build_opener(NoRedirects)
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._jobs = metrics.counter('learnnearn_jobs_total', 'Background jobs by kind and final status', ['kind', 'status'])
+        self._duration = metrics.histogram('learnnearn_job_seconds', 'Background job run time', ['kind'])
+
+    def start(self):
+        """Start the pool in this process once (again after a fork)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._wakeup = threading.Event()
+            for i in range(self.threads):
+                threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True).start()
+
+    def notify(self):
+        """Wake an idle thread in this process after a submit."""
+        self._wakeup.set()
+
+    def _run(self):
+        idle_polls = 0
+        while True:
+            try:
+                job = self.queue.claim()
+            except Exception as e:
+                logger.error(f"Could not claim job: {str(e)}")
+                job = None
+            if job is None:
+                idle_polls += 1
+                if idle_polls % 1000 == 0:
+                    self.queue.purge()
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self.run_job(*job)
+
+    def run_job(self, job_id, kind, payload, attempt):
+        logger.info(f"Running {kind} job {job_id} (attempt {attempt})")
+        start = time.perf_counter()
+        result = error = None
+        try:
+            result = self.handlers[kind](payload)
+        except JobFailed as e:
+            error = e.error
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            error = {"error": "Job failed", "details": "An unexpected error occurred. Please try again."}
+        self._duration.observe(time.perf_counter() - start, kind=kind)
+        self._jobs.inc(kind=kind, status=FAILED if error is not None else DONE)
+        callback_url = self.queue.finish(job_id, result, error)
+        if callback_url:
+            self.send_webhook(callback_url, self.queue.get(job_id))
+
+    def send_webhook(self, url, job):
+        """POST the finished job to its callback URL; failures are only logged.
+
+        The URL is checked again because its DNS records may have changed since submission.
+        """
+        request = urllib.request.Request(url, data=json.dumps(job).encode(),
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            check_webhook_url(url, self.webhook_hosts)
+            with self._opener.open(request, timeout=self.webhook_timeout) as response:
+                response.read()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Webhook for job {job['job_id']} failed: {str(e)}")
@@ -0,0 +1,118 @@
+import re
+import json
+import logging
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Outcomes of parsing model output: ok, repaired, partial, failed
+parse_outcomes = metrics.counter('learnnearn_test_json_parse_total', 'Test JSON parse outcomes', ['outcome'])
+
+CODE_FENCE = re.compile(r'^```(?:json)?\s*|\s*```\s*$', re.MULTILINE)
+TRAILING_COMMA = re.compile(r',(\s*[}\]])')
+
+def strip_comments(text):
+    """Remove // and /* */ comments that are outside of JSON strings."""
+    out = []
+    i = 0
+    in_string = False
+    while i < len(text):
+        char = text[i]
+        if in_string:
+            out.append(char)
+            if char == '\\' and i + 1 < len(text):
+                out.append(text[i + 1])
+                i += 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+            out.append(char)
+        elif text.startswith('//', i):
+            end = text.find('\n', i)
+            i = len(text) if end == -1 else end
+            continue
+        elif text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            i = len(text) if end == -1 else end + 2
+            continue
+        else:
+            out.append(char)
+        i += 1
+    return ''.join(out)
+
+def repair(text):
+    """Apply cheap repairs: code fences, comments and trailing commas."""
+    text = CODE_FENCE.sub('', text.strip())
+    return TRAILING_COMMA.sub(r'\1', strip_comments(text))
+
+def decode_first_object(text):
+    """Decode the first complete JSON object in text, ignoring anything after it."""
+    start = text.find('{')
+    if start == -1:
+        raise ValueError("No JSON object in response")
+    obj, _ = json.JSONDecoder().raw_decode(text, start)
+    return obj
+
+def decode_partial_questions(text):
+    """Recover every complete question object from a truncated "questions" array."""
+    match = re.search(r'"questions"\s*:\s*\[', text)
+    if not match:
+        return []
+    decoder = json.JSONDecoder()
+    questions = []
+    position = match.end()
+    while True:
+        start = text.find('{', position)
+        if start == -1:
+            break
+        try:
+            question, position = decoder.raw_decode(text, start)
+        except ValueError:
+            break
+        questions.append(question)
+    return questions
+
+def is_valid_question(question):
+    """Check that a question has text, at least two options and a correct index in range."""
+    if not isinstance(question, dict):
+        return False
+    options = question.get('options')
+    correct = question.get('correct')
+    return (
+        isinstance(question.get('text'), str) and question['text'].strip() != ''
+        and isinstance(options, list) and len(options) >= 2
+        and isinstance(correct, int) and not isinstance(correct, bool)
+        and 0 <= correct < len(options)
+    )
+
+def parse_test_json(text, min_questions=1):
+    """Parse test JSON from model output, repairing or partially accepting it when needed.
+
+    Returns {"questions": [...]} with only valid questions; raises ValueError if fewer
+    than min_questions survive.
+    """
+    outcome = 'ok'
+    try:
+        data = json.loads(text)
+    except ValueError:
+        outcome = 'repaired'
+        repaired = repair(text)
+        try:
+            data = decode_first_object(repaired)
+        except ValueError:
+            outcome = 'partial'
+            data = {'questions': decode_partial_questions(repaired)}
+
+    questions = data.get('questions') if isinstance(data, dict) else None
+    valid = [question for question in questions or [] if is_valid_question(question)]
+    if questions and len(valid) < len(questions) and outcome != 'partial':
+        outcome = 'partial'
+    if len(valid) < min_questions:
+        parse_outcomes.inc(outcome='failed')
+        raise ValueError("Could not extract test data from response")
+
+    parse_outcomes.inc(outcome=outcome)
+    if outcome != 'ok':
+        logger.info(f"Accepted {outcome} test JSON with {len(valid)} questions")
+    return {'questions': valid}
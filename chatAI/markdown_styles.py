@@ -0,0 +1,63 @@
+import re
+import threading
+import xml.etree.ElementTree as etree
+import markdown
+from markdown.extensions import Extension
+from markdown.treeprocessors import Treeprocessor
+
+# Tailwind classes added to each element type
+ELEMENT_CLASSES = {
+    'h1': 'text-2xl font-bold text-accent mb-4 border-b border-accent pb-2',
+    'h2': 'text-xl font-semibold text-light mb-3 flex items-center gap-2',
+    'p': 'mb-4 text-gray-200',
+    'ul': 'list-disc pl-6 mb-4 space-y-2',
+    'ol': 'list-decimal pl-6 mb-4 space-y-2',
+    'li': 'mb-2 text-gray-200',
+}
+
+# Font Awesome icons for the study plan sections
+SECTION_ICONS = {
+    'key topics and concepts': 'fas fa-book text-accent',
+    'learning objectives': 'fas fa-bullseye text-accent',
+    'study schedule': 'fas fa-calendar text-accent',
+    'practice exercises': 'fas fa-pencil-alt text-accent',
+    'additional resources': 'fas fa-link text-accent',
+    'progress tracking': 'fas fa-chart-line text-accent',
+}
+
+HEADINGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+
+# Leading numbering, emoji and punctuation the model puts before section titles
+TITLE_PREFIX = re.compile(r'^[\W\d_]+')
+
+class StyleTreeprocessor(Treeprocessor):
+    """Add Tailwind classes and section icons to the element tree in one pass."""
+
+    def run(self, root):
+        for element in root.iter():
+            css_class = ELEMENT_CLASSES.get(element.tag)
+            if css_class:
+                element.set('class', css_class)
+            if element.tag in HEADINGS and len(element) == 0 and element.text:
+                icon = SECTION_ICONS.get(TITLE_PREFIX.sub('', element.text).strip().lower())
+                if icon:
+                    icon_element = etree.Element('i', {'class': icon})
+                    icon_element.tail = f" {element.text}"
+                    element.text = None
+                    element.insert(0, icon_element)
+
+class StyleExtension(Extension):
+    """Markdown extension that styles study plan HTML while rendering."""
+
+    def extendMarkdown(self, md):
+        # Run after inline processing so heading text is final
+        md.treeprocessors.register(StyleTreeprocessor(md), 'tailwind_styles', 5)
+
+_local = threading.local()
+
+def render(text):
+    """Render markdown to styled HTML with a reusable per-thread Markdown instance."""
+    md = getattr(_local, 'md', None)
+    if md is None:
+        md = _local.md = markdown.Markdown(extensions=[StyleExtension()])
+    return md.reset().convert(text)
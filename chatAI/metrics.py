@@ -0,0 +1,226 @@
+"""Prometheus-style metrics that stay correct across gunicorn workers.
+
+Each process keeps its samples in memory and periodically writes them to
+METRICS_DIR/<pid>.json. A scrape merges every file: counters and histograms
+are summed over all processes (including exited workers), gauges only over
+processes that are still alive.
+"""
+import os
+import json
+import time
+import atexit
+import tempfile
+import threading
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'learnnearn-metrics'))
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 1.0))
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_metrics = {}
+_lock = threading.Lock()
+_dirty = False
+_flusher_pid = None
+
+class Metric:
+    """Base class holding samples keyed by label values."""
+
+    type = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.samples = {}
+        with _lock:
+            _metrics[name] = self
+
+    def _key(self, labels):
+        return json.dumps([str(labels.get(name, '')) for name in self.labelnames])
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+        maybe_flush()
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+        maybe_flush()
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with _lock:
+            self.samples[self._key(labels)] = value
+        maybe_flush()
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            # Per-bucket (non-cumulative) counts, then sum and count
+            sample = self.samples.get(key)
+            if sample is None:
+                sample = self.samples[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample[i] += 1
+                    break
+            sample[-2] += value
+            sample[-1] += 1
+        maybe_flush()
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the enclosed block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+def counter(name, help_text, labelnames=()):
+    return _metrics.get(name) or Counter(name, help_text, labelnames)
+
+def gauge(name, help_text, labelnames=()):
+    return _metrics.get(name) or Gauge(name, help_text, labelnames)
+
+def histogram(name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return _metrics.get(name) or Histogram(name, help_text, labelnames, buckets)
+
+def _snapshot():
+    with _lock:
+        return {
+            metric.name: {
+                'type': metric.type,
+                'help': metric.help,
+                'labelnames': metric.labelnames,
+                'buckets': getattr(metric, 'buckets', None),
+                'samples': {key: value[:] if isinstance(value, list) else value
+                            for key, value in metric.samples.items()}
+            }
+            for metric in _metrics.values()
+        }
+
+def flush():
+    """Write this process's samples to its file in METRICS_DIR."""
+    global _dirty
+    _dirty = False
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=METRICS_DIR, delete=False) as f:
+            json.dump(_snapshot(), f)
+        os.replace(f.name, os.path.join(METRICS_DIR, f"{os.getpid()}.json"))
+    except OSError as e:
+        logger.warning(f"Could not write metrics: {str(e)}")
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        if _dirty:
+            flush()
+
+def maybe_flush():
+    """Mark samples as changed; a per-process thread writes them every METRICS_FLUSH_INTERVAL."""
+    global _dirty, _flusher_pid
+    _dirty = True
+    if _flusher_pid != os.getpid():
+        with _lock:
+            if _flusher_pid != os.getpid():
+                _flusher_pid = os.getpid()
+                threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True).start()
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render():
+    """Merge the samples of all processes into the Prometheus text format."""
+    flush()
+    merged = {}
+    for filename in os.listdir(METRICS_DIR):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            pid = int(filename[:-5])
+            with open(os.path.join(METRICS_DIR, filename)) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        alive = _is_alive(pid)
+        for name, metric in snapshot.items():
+            if metric['type'] == 'gauge' and not alive:
+                continue
+            target = merged.setdefault(name, dict(metric, samples={}))
+            for key, value in metric['samples'].items():
+                if key not in target['samples']:
+                    target['samples'][key] = value
+                elif isinstance(value, list):
+                    target['samples'][key] = [a + b for a, b in zip(target['samples'][key], value)]
+                else:
+                    target['samples'][key] += value
+
+    lines = []
+    for name in sorted(merged):
+        metric = merged[name]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for key, value in sorted(metric['samples'].items()):
+            values = json.loads(key)
+            if metric['type'] == 'histogram':
+                cumulative = 0
+                for bound, count in zip(metric['buckets'], value):
+                    cumulative += count
+                    labels = _format_labels(metric['labelnames'], values, [('le', _format_value(float(bound)))])
+                    lines.append(f"{name}_bucket{labels} {cumulative}")
+                labels = _format_labels(metric['labelnames'], values, [('le', '+Inf')])
+                lines.append(f"{name}_bucket{labels} {value[-1]}")
+                labels = _format_labels(metric['labelnames'], values)
+                lines.append(f"{name}_sum{labels} {_format_value(value[-2])}")
+                lines.append(f"{name}_count{labels} {value[-1]}")
+            else:
+                lines.append(f"{name}{_format_labels(metric['labelnames'], values)} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+def clear():
+    """Remove all per-process files (called once when the server starts)."""
+    if os.path.isdir(METRICS_DIR):
+        for filename in os.listdir(METRICS_DIR):
+            try:
+                os.unlink(os.path.join(METRICS_DIR, filename))
+            except OSError:
+                pass
+
+atexit.register(flush)
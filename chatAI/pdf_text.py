@@ -0,0 +1,53 @@
+import io
+import os
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from PyPDF2 import PdfReader
+
+logger = logging.getLogger(__name__)
+
+# Large PDFs are split into page ranges and extracted on a process pool
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', 150))
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', min(4, os.cpu_count() or 1)))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the per-worker process pool used for page-parallel extraction."""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                # Spawn rather than fork: the web worker is threaded and holds gRPC state
+                _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+                _pool_pid = os.getpid()
+    return _pool
+
+def extract_page_range(pdf_bytes, start, end):
+    """Extract the text of pages [start, end) from raw PDF bytes."""
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+def extract_text(stream):
+    """Extract text from a seekable PDF stream without writing it to disk."""
+    stream.seek(0)
+    reader = PdfReader(stream)
+    page_count = len(reader.pages)
+
+    if PDF_WORKERS > 1 and page_count >= PDF_PARALLEL_MIN_PAGES:
+        stream.seek(0)
+        pdf_bytes = stream.read()
+        step = -(-page_count // PDF_WORKERS)  # Ceiling division
+        ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+        logger.info(f"Extracting {page_count} pages in {len(ranges)} parallel ranges")
+        futures = [get_pool().submit(extract_page_range, pdf_bytes, start, end) for start, end in ranges]
+        pages = [text for future in futures for text in future.result()]
+    else:
+        pages = [page.extract_text() or "" for page in reader.pages]
+
+    return "\n".join(pages) + "\n"
@@ -0,0 +1,154 @@
+import time
+import asyncio
+import logging
+from cache import get_connection, rollback, DEFAULT_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+class RateLimitExceeded(Exception):
+    """Raised when a request would have to wait longer than its priority allows."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Rate limit reached (429), retry after {retry_after:.1f} seconds")
+        self.retry_after = retry_after
+
+class RateLimiter:
+    """Token buckets for requests and tokens per minute, shared by all workers through SQLite.
+
+    Interactive requests reserve capacity up front and may drive a bucket negative,
+    so queued reservations push later callers back and the computed wait reflects
+    the real queue. Background requests only reserve while every bucket stays above
+    a reserve kept for interactive requests; otherwise they reserve nothing and poll
+    again. A burst of background work therefore never queues ahead of interactive
+    calls.
+    """
+
+    def __init__(self, rpm, tpm, path=DEFAULT_DB_PATH, max_wait=None, background_reserve=0.2):
+        self.buckets = {'requests': float(rpm), 'tokens': float(tpm)}
+        self.path = path
+        self.max_wait = max_wait or {INTERACTIVE: 5, BACKGROUND: 300}
+        self.background_reserve = background_reserve
+        conn = get_connection(path)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        now = time.time()
+        for name, capacity in self.buckets.items():
+            conn.execute('INSERT OR IGNORE INTO rate_limits (name, tokens, updated_at) VALUES (?, ?, ?)',
+                         (name, capacity, now))
+
+    def _levels(self, conn, now):
+        """Return the refilled level of each bucket."""
+        levels = {}
+        for name, tokens, updated_at in conn.execute('SELECT name, tokens, updated_at FROM rate_limits'):
+            capacity = self.buckets.get(name)
+            if capacity is not None:
+                levels[name] = min(capacity, tokens + (now - updated_at) * capacity / 60)
+        return levels
+
+    def _wait(self, levels, costs, priority):
+        """Seconds until every bucket can cover its cost for the given priority."""
+        wait = 0.0
+        for name, capacity in self.buckets.items():
+            reserve = capacity * self.background_reserve if priority == BACKGROUND else 0
+            deficit = costs[name] + reserve - levels[name]
+            if deficit > 0:
+                wait = max(wait, deficit * 60 / capacity)
+        return wait
+
+    def _max_wait(self, priority):
+        return self.max_wait.get(priority, self.max_wait[INTERACTIVE])
+
+    def reserve(self, token_cost, priority=INTERACTIVE):
+        """Try to reserve capacity for one request and return how long to wait.
+
+        Interactive reservations always succeed and the wait is until the request may
+        be sent. A background reservation only succeeds with a wait of 0; a positive
+        wait means nothing was reserved and the caller should try again after it.
+        Raises RateLimitExceeded, without reserving, when the wait exceeds the priority's limit.
+        """
+        costs = {'requests': 1, 'tokens': min(token_cost, self.buckets['tokens'])}
+        conn = get_connection(self.path)
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            levels = self._levels(conn, now)
+            wait = self._wait(levels, costs, priority)
+            if wait > self._max_wait(priority):
+                conn.execute('ROLLBACK')
+                raise RateLimitExceeded(wait)
+            if priority == BACKGROUND and wait > 0:
+                conn.execute('COMMIT')
+                return wait
+            conn.executemany('UPDATE rate_limits SET tokens = ?, updated_at = ? WHERE name = ?',
+                             [(levels[name] - costs[name], now, name) for name in self.buckets])
+            conn.execute('COMMIT')
+        except RateLimitExceeded:
+            raise
+        except Exception:
+            rollback(conn)
+            raise
+        if wait > 0:
+            logger.info(f"Waiting {wait:.1f} seconds for Gemini capacity ({priority})")
+        return wait
+
+    def acquire(self, token_cost, priority=INTERACTIVE):
+        """Reserve capacity and block until it is available."""
+        deadline = time.time() + self._max_wait(priority)
+        while True:
+            wait = self.reserve(token_cost, priority)
+            reserved = priority != BACKGROUND or wait == 0
+            if not reserved and time.time() + wait > deadline:
+                raise RateLimitExceeded(wait)
+            if wait > 0:
+                time.sleep(wait)
+            if reserved:
+                return
+
+    async def acquire_async(self, token_cost, priority=INTERACTIVE):
+        """Reserve capacity and wait for it without blocking the event loop.
+
+        The reservation runs in a thread: it may wait on the SQLite write lock. A
+        reservation whose caller is cancelled while waiting is given back.
+        """
+        deadline = time.time() + self._max_wait(priority)
+        while True:
+            wait = await asyncio.to_thread(self.reserve, token_cost, priority)
+            reserved = priority != BACKGROUND or wait == 0
+            if not reserved and time.time() + wait > deadline:
+                raise RateLimitExceeded(wait)
+            try:
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                if reserved:
+                    asyncio.get_running_loop().run_in_executor(None, self.release, token_cost)
+                raise
+            if reserved:
+                return
+
+    def release(self, token_cost, requests=1):
+        """Give back capacity reserved for a request that was not sent, or only partly used."""
+        costs = {'requests': requests, 'tokens': min(token_cost, self.buckets['tokens'])}
+        conn = get_connection(self.path)
+        conn.executemany('UPDATE rate_limits SET tokens = MIN(?, tokens + ?) WHERE name = ?',
+                         [(capacity, costs[name], name) for name, capacity in self.buckets.items()])
+
+    def retry_after(self, token_cost=0, priority=INTERACTIVE):
+        """Estimate how long a new request would currently have to wait."""
+        costs = {'requests': 1, 'tokens': min(token_cost, self.buckets['tokens'])}
+        levels = self._levels(get_connection(self.path), time.time())
+        return self._wait(levels, costs, priority)
+
+    def drain(self):
+        """Empty all buckets after the API reports exhausted quota."""
+        conn = get_connection(self.path)
+        now = time.time()
+        conn.execute('UPDATE rate_limits SET tokens = MIN(tokens, 0), updated_at = ?', (now,))
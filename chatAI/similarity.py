@@ -0,0 +1,233 @@
+import re
+import json
+import time
+import random
+import hashlib
+import logging
+from collections import Counter
+from cache import get_connection, rollback, DEFAULT_DB_PATH
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Words that do not change what a study plan is about
+FILLER_WORDS = {
+    'a', 'an', 'the', 'to', 'of', 'for', 'and', 'in', 'on', 'with', 'about', 'how', 'me', 'my', 'i', 'want',
+    'intro', 'introduction', 'basic', 'basics', 'fundamental', 'fundamentals', 'beginner', 'beginners',
+    'guide', 'learn', 'course', 'tutorial', 'overview', 'plan', 'please',
+}
+WORD = re.compile(r'[a-z0-9+#]+')
+
+NUM_PERMUTATIONS = 64
+BANDS = 16
+ROWS = NUM_PERMUTATIONS // BANDS
+# Candidates must share this many bands; at 0.8 similarity that still finds >99.9% of matches
+MIN_SHARED_BANDS = 2
+MERSENNE_PRIME = (1 << 61) - 1
+# Words this long with the same first two letters and one edit apart are spelling variants
+# ("organisation", "organization"); shorter words ("neural", "neutral") must match exactly
+MIN_VARIANT_LENGTH = 7
+
+# Fixed seed so every worker computes the same signatures
+_random = random.Random(1729)
+PERMUTATIONS = [(_random.randrange(1, MERSENNE_PRIME), _random.randrange(MERSENNE_PRIME))
+                for _ in range(NUM_PERMUTATIONS)]
+
+def normalize_topic(text):
+    """Lowercase a topic, drop filler words and plural endings, and sort the remaining words."""
+    words = []
+    for word in WORD.findall((text or '').casefold()):
+        if word in FILLER_WORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        words.append(word)
+    return ' '.join(sorted(set(words)))
+
+def trigrams(word):
+    padded = f"#{word}#"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def shingles(normalized):
+    """Words plus character trigrams of each word, so near-identical spellings overlap."""
+    result = set()
+    for word in normalized.split():
+        result.add(word)
+        result.update(trigrams(word))
+    return result
+
+def is_spelling_variant(word, other):
+    """Check whether two words are spellings of the same word: long, same start, at most one edit apart."""
+    if min(len(word), len(other)) < MIN_VARIANT_LENGTH or word[:2] != other[:2] or abs(len(word) - len(other)) > 1:
+        return False
+    # Single-row Levenshtein distance
+    previous = list(range(len(other) + 1))
+    for i, char in enumerate(word, 1):
+        current = [i]
+        for j, other_char in enumerate(other, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other_char)))
+        previous = current
+    return previous[-1] <= 1
+
+def same_terms(words, other):
+    """Check that two normalized topics name the same things.
+
+    Words containing digits must match exactly, and every other word needs the
+    same word or a spelling variant on the other side. One differing word in a
+    long topic barely moves the shingle similarity, so this is checked separately.
+    """
+    words, other = set(words.split()), set(other.split())
+    numbers = {word for word in words if any(c.isdigit() for c in word)}
+    other_numbers = {word for word in other if any(c.isdigit() for c in word)}
+    if numbers != other_numbers:
+        return False
+
+    def has_variant(word, candidates):
+        return word in candidates or any(is_spelling_variant(word, candidate) for candidate in candidates)
+
+    return (all(has_variant(word, other - other_numbers) for word in words - numbers)
+            and all(has_variant(word, words - numbers) for word in other - other_numbers))
+
+def topic_similarity(topic, other):
+    """Return the shingle similarity of two topics, or 0.0 when they name different things.
+
+    >>> topic_similarity("Intro to Python", "intro to python basics")
+    1.0
+    >>> topic_similarity("Intro to Python", "Python for beginners")
+    1.0
+    >>> topic_similarity("Python for beginners", "Advanced Python")
+    0.0
+    >>> topic_similarity("Organisation of cells", "organization of cells") >= 0.5
+    True
+    >>> topic_similarity("Chapter 3 of my textbook", "Chapter 5 of my textbook")
+    0.0
+    >>> topic_similarity("IELTS writing task 1", "IELTS writing task 2")
+    0.0
+    >>> topic_similarity("Java", "JavaScript")
+    0.0
+    >>> topic_similarity("Organic chemistry reactions and mechanisms", "Inorganic chemistry reactions and mechanisms")
+    0.0
+    >>> topic_similarity("Microeconomics supply and demand curves", "Macroeconomics supply and demand curves")
+    0.0
+    >>> topic_similarity("Hypertension treatment", "Hypotension treatment")
+    0.0
+    >>> topic_similarity("Neural networks", "Neutral networks")
+    0.0
+    """
+    normalized, other = normalize_topic(topic), normalize_topic(other)
+    if not same_terms(normalized, other):
+        return 0.0
+    return jaccard(shingles(normalized), shingles(other))
+
+def minhash(features):
+    """Return the MinHash signature of a set of strings."""
+    values = [int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), 'big')
+              for feature in features]
+    return [min((a * value + b) % MERSENNE_PRIME for value in values) for a, b in PERMUTATIONS]
+
+def band_buckets(signature):
+    """Split a signature into LSH band buckets; similar sets share at least one bucket."""
+    return [
+        f"{band}:" + hashlib.md5(json.dumps(signature[band * ROWS:(band + 1) * ROWS]).encode()).hexdigest()[:16]
+        for band in range(BANDS)
+    ]
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+class TopicIndex:
+    """MinHash/LSH index from study topics to cache keys, shared by all workers through SQLite.
+
+    Lookups find candidates through the LSH buckets and accept the most similar one
+    that names the same things (see same_terms) and whose exact Jaccard similarity
+    reaches the threshold. Entries expire after ttl seconds, which should match the
+    cache the keys point into.
+    """
+
+    def __init__(self, namespace, ttl, threshold=0.8, path=DEFAULT_DB_PATH):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.threshold = threshold
+        self.path = path
+        self._lookups = metrics.counter('learnnearn_topic_index_lookups_total', 'Near-duplicate topic lookups', ['index', 'result'])
+        conn = get_connection(path)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS topic_index (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                topic TEXT NOT NULL,
+                shingles TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS topic_buckets (
+                namespace TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (namespace, bucket, key)
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS topic_index_created ON topic_index (namespace, created_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS topic_buckets_key ON topic_buckets (namespace, key)')
+
+    def lookup(self, topic):
+        """Return (key, similarity) of the most similar indexed topic, or (None, 0.0)."""
+        normalized = normalize_topic(topic)
+        features = shingles(normalized)
+        if not features:
+            return None, 0.0
+        conn = get_connection(self.path)
+        buckets = band_buckets(minhash(features))
+        shared = Counter(key for key, in conn.execute(
+            f"SELECT key FROM topic_buckets WHERE namespace = ? AND bucket IN ({','.join('?' * len(buckets))})",
+            (self.namespace, *buckets)
+        ))
+        candidates = [key for key, count in shared.items() if count >= MIN_SHARED_BANDS]
+        rows = conn.execute(
+            f"SELECT key, topic, shingles FROM topic_index WHERE namespace = ? AND created_at > ? "
+            f"AND key IN ({','.join('?' * len(candidates))})",
+            (self.namespace, time.time() - self.ttl, *candidates)
+        ).fetchall() if candidates else []
+        best_key, best = None, 0.0
+        for key, candidate_topic, candidate in rows:
+            if not same_terms(normalized, candidate_topic):
+                continue
+            similarity = jaccard(features, set(json.loads(candidate)))
+            if similarity > best:
+                best_key, best = key, similarity
+        if best < self.threshold:
+            self._lookups.inc(index=self.namespace, result='miss')
+            return None, best
+        self._lookups.inc(index=self.namespace, result='match')
+        return best_key, best
+
+    def add(self, topic, key):
+        """Index a topic under the cache key of its result."""
+        normalized = normalize_topic(topic)
+        features = shingles(normalized)
+        if not features:
+            return
+        conn = get_connection(self.path)
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._purge(conn, now)
+            conn.execute('INSERT OR REPLACE INTO topic_index (namespace, key, topic, shingles, created_at) '
+                         'VALUES (?, ?, ?, ?, ?)',
+                         (self.namespace, key, normalized, json.dumps(sorted(features)), now))
+            conn.executemany('INSERT OR IGNORE INTO topic_buckets (namespace, bucket, key) VALUES (?, ?, ?)',
+                             [(self.namespace, bucket, key) for bucket in band_buckets(minhash(features))])
+            conn.execute('COMMIT')
+        except Exception:
+            rollback(conn)
+            raise
+
+    def _purge(self, conn, now):
+        expired = [row[0] for row in conn.execute(
+            'SELECT key FROM topic_index WHERE namespace = ? AND created_at <= ?', (self.namespace, now - self.ttl)
+        )]
+        for key in expired:
+            conn.execute('DELETE FROM topic_buckets WHERE namespace = ? AND key = ?', (self.namespace, key))
+            conn.execute('DELETE FROM topic_index WHERE namespace = ? AND key = ?', (self.namespace, key))
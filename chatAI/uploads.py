@@ -0,0 +1,197 @@
+import os
+import re
+import time
+import uuid
+import hashlib
+import tempfile
+import threading
+import logging
+from cache import get_connection, DEFAULT_DB_PATH
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent chunks for one upload are not serialized across processes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_UPLOAD_DIR = os.path.join(tempfile.gettempdir(), 'learnnearn-uploads')
+BLOCK_SIZE = 64 * 1024
+SHA256_HEX = re.compile(r'[0-9a-f]{64}')
+
+class UploadError(Exception):
+    """Raised when a chunk cannot be applied; status is the HTTP status to report."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def is_sha256(value):
+    """Check that value is a lowercase hex SHA-256 digest, safe to use in file paths."""
+    return isinstance(value, str) and SHA256_HEX.fullmatch(value) is not None
+
+class UploadStore:
+    """Resumable uploads written to disk chunk by chunk, shared by all workers.
+
+    Session metadata lives in SQLite; the bytes received so far live in
+    <directory>/partial/<id>.part, whose size is the upload offset. Chunks are
+    hashed as they arrive when consecutive chunks reach the same worker; otherwise
+    the file is hashed once on completion. Completed uploads are moved to
+    <directory>/<sha256>.pdf.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, directory=DEFAULT_UPLOAD_DIR, max_size=10 * 1024 * 1024, ttl=86400):
+        self.path = path
+        self.directory = directory
+        self.max_size = max_size
+        self.ttl = ttl
+        self._hashers = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directory, 'partial'), exist_ok=True)
+        get_connection(path).execute('''
+            CREATE TABLE IF NOT EXISTS uploads (
+                id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                sha256 TEXT,
+                digest TEXT,
+                created_at REAL NOT NULL
+            )
+        ''')
+
+    def _partial_path(self, upload_id):
+        return os.path.join(self.directory, 'partial', f"{upload_id}.part")
+
+    def completed_path(self, digest):
+        return os.path.join(self.directory, f"{digest}.pdf")
+
+    def create(self, filename, size, sha256=None, digest=None):
+        """Start an upload of size bytes; pass digest to record it as already complete."""
+        if size <= 0 or size > self.max_size:
+            raise UploadError(f"File size must be between 1 byte and {self.max_size/1024/1024}MB", 413)
+        if any(value is not None and not is_sha256(value) for value in (sha256, digest)):
+            raise UploadError("sha256 must be 64 hexadecimal characters")
+        self.purge()
+        upload_id = uuid.uuid4().hex
+        if digest is None:
+            open(self._partial_path(upload_id), 'wb').close()
+        get_connection(self.path).execute(
+            'INSERT INTO uploads (id, filename, size, sha256, digest, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (upload_id, filename, size, sha256, digest, time.time())
+        )
+        return self.get(upload_id)
+
+    def get(self, upload_id):
+        """Return the state of an upload, or None if it is unknown or expired."""
+        row = get_connection(self.path).execute(
+            'SELECT id, filename, size, digest, created_at FROM uploads WHERE id = ? AND created_at > ?',
+            (upload_id, time.time() - self.ttl)
+        ).fetchone()
+        if row is None:
+            return None
+        upload_id, filename, size, digest, created_at = row
+        if digest is not None:
+            offset = size
+        else:
+            try:
+                offset = os.path.getsize(self._partial_path(upload_id))
+            except OSError:
+                return None
+        return {
+            "upload_id": upload_id,
+            "filename": filename,
+            "size": size,
+            "offset": offset,
+            "complete": digest is not None,
+            "digest": digest
+        }
+
+    def append(self, upload_id, offset, stream, length=None):
+        """Write the chunk in stream at offset and return the new state.
+
+        The offset must match the bytes received so far, so a client can resume by
+        asking for the state and sending the rest.
+        """
+        upload = self.get(upload_id)
+        if upload is None:
+            raise UploadError("Unknown or expired upload", 404)
+        if upload['complete']:
+            raise UploadError("Upload is already complete", 409)
+        if length is not None and offset + length > upload['size']:
+            raise UploadError("Chunk extends past the declared upload size", 413)
+
+        with open(self._partial_path(upload_id), 'r+b') as f:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    raise UploadError("Another chunk of this upload is in progress", 409)
+            current = os.fstat(f.fileno()).st_size
+            if offset != current:
+                raise UploadError(f"Expected offset {current}", 409)
+            f.seek(current)
+            hasher = self._take_hasher(upload_id, current)
+            remaining = upload['size'] - current
+            try:
+                while True:
+                    block = stream.read(BLOCK_SIZE)
+                    if not block:
+                        break
+                    if len(block) > remaining:
+                        raise UploadError("Chunk extends past the declared upload size", 413)
+                    f.write(block)
+                    remaining -= len(block)
+                    if hasher is not None:
+                        hasher.update(block)
+            finally:
+                # Keep whatever arrived (even from a dropped connection) so the client can resume
+                f.flush()
+                if hasher is not None:
+                    with self._lock:
+                        self._hashers[upload_id] = (f.tell(), hasher)
+            offset = f.tell()
+
+        if offset == upload['size']:
+            return self._complete(upload_id)
+        return self.get(upload_id)
+
+    def _take_hasher(self, upload_id, offset):
+        """Return the in-process hash state for the bytes before offset, if this worker has it."""
+        with self._lock:
+            hashed, hasher = self._hashers.pop(upload_id, (None, None))
+        if hasher is None and offset == 0:
+            return hashlib.sha256()
+        return hasher if hashed == offset else None
+
+    def _complete(self, upload_id):
+        with self._lock:
+            _, hasher = self._hashers.pop(upload_id, (None, None))
+        partial = self._partial_path(upload_id)
+        if hasher is None:
+            hasher = hashlib.sha256()
+            with open(partial, 'rb') as f:
+                for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                    hasher.update(block)
+        digest = hasher.hexdigest()
+
+        conn = get_connection(self.path)
+        expected = conn.execute('SELECT sha256 FROM uploads WHERE id = ?', (upload_id,)).fetchone()[0]
+        if expected and expected.lower() != digest:
+            os.unlink(partial)
+            conn.execute('DELETE FROM uploads WHERE id = ?', (upload_id,))
+            raise UploadError("Uploaded data does not match the declared SHA-256", 422)
+        os.replace(partial, self.completed_path(digest))
+        conn.execute('UPDATE uploads SET digest = ? WHERE id = ?', (digest, upload_id))
+        logger.info(f"Upload {upload_id} complete ({digest[:12]})")
+        return self.get(upload_id)
+
+    def purge(self):
+        """Forget expired uploads and delete their partial files."""
+        conn = get_connection(self.path)
+        cutoff = time.time() - self.ttl
+        for upload_id, in conn.execute('SELECT id FROM uploads WHERE created_at <= ?', (cutoff,)).fetchall():
+            try:
+                os.unlink(self._partial_path(upload_id))
+            except OSError:
+                pass
+            conn.execute('DELETE FROM uploads WHERE id = ?', (upload_id,))